@@ -13,3 +13,9 @@ os.environ["DATABASE_URL"] = "postgres://{}:{}@{}:{}/{}".format(
 sys.path.insert(0, "/app/orochi")
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings.local")
 django.setup()
+
+# Warm the volatility plugin cache at worker boot so the first
+# run_plugin/get_parameters task does not pay the import walk
+from orochi.utils.volatility_dask_elk import get_plugin_list
+
+get_plugin_list()
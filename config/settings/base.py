@@ -243,6 +243,7 @@ STATICFILES_FINDERS += ["compressor.finders.CompressorFinder"]
 # Elasticsearch
 # -------------------------------------------------------------------------------
 ELASTICSEARCH_URL = env("ELASTICSEARCH_URL")
+ELASTICSEARCH_BULK_CHUNK_SIZE = env.int("ELASTICSEARCH_BULK_CHUNK_SIZE", default=1000)
 
 
 # Dask
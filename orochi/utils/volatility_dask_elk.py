@@ -1,19 +1,24 @@
+import asyncio
 import io
 import os
 import attr
-import uuid
+import shutil
 import traceback
 import hashlib
-import json
 import tempfile
 import pathlib
 import datetime
+import functools
+import logging
+import threading
 
+import orjson
 import pyclamd
 import virustotal3.core
 from regipy.registry import RegistryHive
 from regipy.plugins.utils import dump_hive_to_json
 
+from concurrent.futures import ThreadPoolExecutor
 from glob import glob
 from typing import Any, List, Tuple, Dict, Optional, Union
 from urllib.request import pathname2url
@@ -40,8 +45,9 @@ from volatility.framework import (
     plugins,
 )
 
-from zipfile import ZipFile, is_zipfile
+from zipfile import BadZipFile, ZipFile
 from elasticsearch import Elasticsearch, helpers
+from elasticsearch.serializer import JSONSerializer
 from orochi.website.models import (
     Dump,
     Plugin,
@@ -63,6 +69,64 @@ from asgiref.sync import async_to_sync
 from channels.layers import get_channel_layer
 
 
+class OrjsonSerializer(JSONSerializer):
+    """
+    Elasticsearch serializer backed by orjson, way faster on big payloads
+    """
+
+    def dumps(self, data):
+        if isinstance(data, (str, bytes)):
+            return data
+        return orjson.dumps(data, default=self.default).decode()
+
+    def loads(self, s):
+        return orjson.loads(s)
+
+
+@functools.lru_cache(maxsize=1)
+def get_elastic_client(es_url):
+    """
+    Returns a cached elasticsearch client, one per worker process.
+    Avoids paying connection pool setup on every plugin run.
+    """
+    return Elasticsearch(
+        [es_url],
+        request_timeout=60,
+        timeout=60,
+        max_retries=10,
+        retry_on_timeout=True,
+        serializer=OrjsonSerializer(),
+    )
+
+
+@functools.lru_cache(maxsize=1)
+def get_vt_files():
+    """
+    Returns a cached virustotal client built from the configured service.
+    Raises ObjectDoesNotExist if the service is not configured.
+    """
+    vt = Service.objects.get(name=1)
+    return virustotal3.core.Files(vt.key, proxies=vt.proxy)
+
+
+_plugin_list = None
+_plugin_list_lock = threading.Lock()
+
+
+def get_plugin_list():
+    """
+    Imports volatility plugins once per process and returns the cached list.
+    Dask workers are long lived so the import walk is paid only on first use.
+    """
+    global _plugin_list
+    if _plugin_list is None:
+        with _plugin_list_lock:
+            if _plugin_list is None:
+                framework.import_files(volatility.plugins, True)
+                _plugin_list = framework.list_plugins()
+    return _plugin_list
+
+
 class MuteProgress(object):
     """
     Mutes progress for volatility plugin
@@ -96,18 +160,42 @@ def file_handler_class_factory(output_dir, file_list):
             fd, self._name = tempfile.mkstemp(suffix=".vol3", prefix="tmp_")
             self._file = io.open(fd, mode="w+b")
             interfaces.plugins.FileHandlerInterface.__init__(self, filename)
-            for item in dir(self._file):
-                if not item.startswith("_") and not item in [
-                    "closed",
-                    "close",
-                    "mode",
-                    "name",
-                ]:
-                    setattr(self, item, getattr(self._file, item))
 
         def __getattr__(self, item):
             return getattr(self._file, item)
 
+        # io.RawIOBase defines the I/O methods, so __getattr__ never sees
+        # them; forward each one to the temp file explicitly
+        def write(self, b):
+            return self._file.write(b)
+
+        def read(self, size=-1):
+            return self._file.read(size)
+
+        def readinto(self, b):
+            return self._file.readinto(b)
+
+        def seek(self, offset, whence=io.SEEK_SET):
+            return self._file.seek(offset, whence)
+
+        def tell(self):
+            return self._file.tell()
+
+        def truncate(self, size=None):
+            return self._file.truncate(size)
+
+        def flush(self):
+            return self._file.flush()
+
+        def seekable(self):
+            return self._file.seekable()
+
+        def readable(self):
+            return self._file.readable()
+
+        def writable(self):
+            return self._file.writable()
+
         @property
         def closed(self):
             return self._file.closed
@@ -130,6 +218,12 @@ def file_handler_class_factory(output_dir, file_list):
             self.close()
             os.remove(self._name)
 
+        def commit(self, dest):
+            """Closes the underlying file and moves it to its final path"""
+            self._file.close()
+            # shutil.move copes with media living on a different device
+            shutil.move(self._name, dest)
+
         def close(self):
             """Closes and commits the file (by moving the temporary file to the correct name"""
             # Don't overcommit
@@ -161,6 +255,15 @@ class ReturnJsonRenderer(JsonRenderer):
     def render(self, grid: interfaces.renderers.TreeGrid):
         final_output = ({}, [])
 
+        # Resolve column names and renderers once, not per cell
+        columns = [
+            (
+                column.name,
+                self._type_renderers.get(column.type, self._type_renderers["default"]),
+            )
+            for column in grid.columns
+        ]
+
         def visitor(
             node: Optional[interfaces.renderers.TreeNode],
             accumulator: Tuple[Dict[str, Dict[str, Any]], List[Dict[str, Any]]],
@@ -168,15 +271,11 @@ class ReturnJsonRenderer(JsonRenderer):
             # Nodes always have a path value, giving them a path_depth of at least 1, we use max just in case
             acc_map, final_tree = accumulator
             node_dict = {"__children": []}
-            for column_index in range(len(grid.columns)):
-                column = grid.columns[column_index]
-                renderer = self._type_renderers.get(
-                    column.type, self._type_renderers["default"]
-                )
-                data = renderer(list(node.values)[column_index])
+            for (name, renderer), value in zip(columns, node.values):
+                data = renderer(value)
                 if isinstance(data, interfaces.renderers.BaseAbsentValue):
                     data = None
-                node_dict[column.name] = data
+                node_dict[name] = data
             if node.parent:
                 acc_map[node.parent.path]["__children"].append(node_dict)
             else:
@@ -196,29 +295,32 @@ def gendata(index, plugin_name, result):
         yield {
             "_index": index,
             # "_type": plugin_name,
-            "_id": uuid.uuid4(),
             "_source": item,
         }
 
 
-def sha256_checksum(filename, block_size=65536):
+def sha256_checksum(filename, block_size=1024 * 1024):
     """
     Generate sha256 for filename
     """
-    sha256 = hashlib.sha256()
-    with open(filename, "rb") as f:
+    # Unbuffered handle: hashing reads in large blocks, double buffering is useless
+    with open(filename, "rb", buffering=0) as f:
+        if hasattr(hashlib, "file_digest"):
+            return hashlib.file_digest(f, "sha256").hexdigest()
+        sha256 = hashlib.sha256()
         for block in iter(lambda: f.read(block_size), b""):
             sha256.update(block)
-    return sha256.hexdigest()
+        return sha256.hexdigest()
 
 
+@functools.lru_cache(maxsize=512)
 def get_parameters(plugin):
     """
-    Obtains parameters list from volatility plugin
+    Obtains parameters list from volatility plugin.
+    Parameters are static for a given volatility install, so cache per plugin.
     """
     ctx = contexts.Context()
-    failures = framework.import_files(volatility.plugins, True)
-    plugin_list = framework.list_plugins()
+    plugin_list = get_plugin_list()
     params = []
     if plugin in plugin_list:
         for requirement in plugin_list[plugin].get_requirements():
@@ -252,47 +354,66 @@ def get_parameters(plugin):
     return params
 
 
-def run_vt(result_pk, filepath):
+def run_vt(result_pk, filepaths):
     """
-    Runs virustotal on filepath
+    Runs virustotal on a batch of dumped files
     """
+    eds = list(
+        ExtractedDump.objects.filter(result__pk=result_pk, path__in=filepaths)
+    )
+
     try:
-        vt = Service.objects.get(name=1)
-        vt_files = virustotal3.core.Files(vt.key, proxies=vt.proxy)
+        vt_files = get_vt_files()
+    except ObjectDoesNotExist:
+        vt_files = None
+
+    def lookup(ed):
+        # Digest has already been calculated on dump, no need to rehash the file
+        sha256 = ed.sha256 or sha256_checksum(ed.path)
         try:
-            vt_report = json.loads(
-                json.dumps(
-                    vt_files.info_file(sha256_checksum(filepath))
-                    .get("data", {})
-                    .get("attributes", {})
-                    .get("last_analysis_stats", {})
-                )
+            # REPORT IS ALREADY A PLAIN DICT, NO NEED TO ROUND-TRIP THROUGH JSON
+            ed.vt_report = (
+                vt_files.info_file(sha256)
+                .get("data", {})
+                .get("attributes", {})
+                .get("last_analysis_stats", {})
+                or None
             )
         except virustotal3.errors.VirusTotalApiError as excp:
-            vt_report = None
-    except ObjectDoesNotExist:
-        vt_report = {"error": "Service not configured"}
+            ed.vt_report = None
 
-    ed = ExtractedDump.objects.get(result__pk=result_pk, path=filepath)
-    ed.vt_report = vt_report
-    ed.save()
+    if not vt_files:
+        for ed in eds:
+            ed.vt_report = {"error": "Service not configured"}
+    elif eds:
+        # NETWORK BOUND: ISSUE UP TO 16 LOOKUPS CONCURRENTLY
+        with ThreadPoolExecutor(max_workers=min(16, len(eds))) as executor:
+            list(executor.map(lookup, eds))
 
+    ExtractedDump.objects.bulk_update(eds, ["vt_report"])
 
-def run_regipy(result_pk, filepath):
+
+def run_regipy(result_pk, filepaths):
     """
-    Runs regipy on filepath
+    Runs regipy on a batch of dumped hives
     """
-    try:
-        registry_hive = RegistryHive(filepath)
-        reg_json = registry_hive.recurse_subkeys(registry_hive.root, as_json=True)
-        root = {"values": [attr.asdict(entry) for entry in reg_json]}
-        root = json.loads(json.dumps(root).replace(r"\u0000", ""))
-    except Exception:
-        root = {}
+    eds = list(
+        ExtractedDump.objects.filter(result__pk=result_pk, path__in=filepaths)
+    )
 
-    ed = ExtractedDump.objects.get(result__pk=result_pk, path=filepath)
-    ed.reg_array = root
-    ed.save()
+    for ed in eds:
+        try:
+            registry_hive = RegistryHive(ed.path)
+            reg_json = registry_hive.recurse_subkeys(registry_hive.root, as_json=True)
+            # Entries are flat attrs instances whose values are already
+            # json-friendly (as_json=True), skip the recursive introspection
+            root = {"values": [attr.asdict(entry, recurse=False) for entry in reg_json]}
+            root = orjson.loads(orjson.dumps(root).replace(b"\\u0000", b""))
+        except Exception:
+            root = {}
+        ed.reg_array = root
+
+    ExtractedDump.objects.bulk_update(eds, ["reg_array"])
 
 
 def send_to_ws(dump, result, plugin_name):
@@ -302,24 +423,37 @@ def send_to_ws(dump, result, plugin_name):
 
     colors = {1: "green", 2: "green", 3: "orange", 4: "red"}
 
-    users = get_users_with_perms(dump, only_with_perms_in=["can_see"])
+    # Materialize before entering the coroutine: a lazy queryset would
+    # evaluate on the event-loop thread and trip the async guard
+    user_pks = list(
+        get_users_with_perms(dump, only_with_perms_in=["can_see"]).values_list(
+            "pk", flat=True
+        )
+    )
 
     channel_layer = get_channel_layer()
-    for user in users:
-        async_to_sync(channel_layer.group_send)(
-            "chat_{}".format(user.pk),
-            {
-                "type": "chat_message",
-                "message": "{}||Plugin <b>{}</b> on dump <b>{}</b> ended<br>Status: <b style='color:{}'>{}</b>".format(
-                    datetime.datetime.now().strftime("%d/%m/%Y %H:%M"),
-                    plugin_name,
-                    dump.name,
-                    colors[result.result],
-                    result.get_result_display(),
-                ),
-            },
+    message = {
+        "type": "chat_message",
+        "message": "{}||Plugin <b>{}</b> on dump <b>{}</b> ended<br>Status: <b style='color:{}'>{}</b>".format(
+            datetime.datetime.now().strftime("%d/%m/%Y %H:%M"),
+            plugin_name,
+            dump.name,
+            colors[result.result],
+            result.get_result_display(),
+        ),
+    }
+
+    # One event loop, all group_sends issued concurrently
+    async def notify():
+        await asyncio.gather(
+            *(
+                channel_layer.group_send("chat_{}".format(pk), message)
+                for pk in user_pks
+            )
         )
 
+    async_to_sync(notify)()
+
 
 def run_plugin(dump_obj, plugin_obj, es_url, params=None):
     """
@@ -327,11 +461,14 @@ def run_plugin(dump_obj, plugin_obj, es_url, params=None):
     If success data are sent to elastic.
     """
     try:
+        # FETCH RESULT ONCE, EVERY STATUS UPDATE BELOW REUSES IT
+        result = Result.objects.select_related("plugin", "dump").get(
+            plugin=plugin_obj, dump=dump_obj
+        )
         ctx = contexts.Context()
         constants.PARALLELISM = constants.Parallelism.Off
-        failures = framework.import_files(volatility.plugins, True)
+        plugin_list = get_plugin_list()
         automagics = automagic.available(ctx)
-        plugin_list = framework.list_plugins()
         json_renderer = ReturnJsonRenderer
         seen_automagics = set()
         for amagic in automagics:
@@ -399,7 +536,6 @@ def run_plugin(dump_obj, plugin_obj, es_url, params=None):
             )
         except exceptions.UnsatisfiedException as excp:
             # LOG UNSATISFIED ERROR
-            result = Result.objects.get(plugin=plugin_obj, dump=dump_obj)
             result.result = 3
             result.description = "\n".join(
                 [
@@ -417,7 +553,6 @@ def run_plugin(dump_obj, plugin_obj, es_url, params=None):
             fulltrace = traceback.TracebackException.from_exception(excp).format(
                 chain=True
             )
-            result = Result.objects.get(plugin=plugin_obj, dump=dump_obj)
             result.result = 4
             result.description = "\n".join(fulltrace)
             result.save()
@@ -431,10 +566,15 @@ def run_plugin(dump_obj, plugin_obj, es_url, params=None):
 
             # IF DUMP STORE FILE ON DISK
             if local_dump and file_list:
-                for file_id in file_list:
-                    output_path = "{}/{}".format(local_path, file_id.preferred_filename)
-                    with open(output_path, "wb") as f:
-                        f.write(file_id.getvalue())
+                # FINAL PATH OF EACH DUMPED FILE, FORMATTED ONCE
+                paths = [
+                    "{}/{}".format(local_path, file_id.preferred_filename)
+                    for file_id in file_list
+                ]
+
+                for file_id, output_path in zip(file_list, paths):
+                    # MOVE TEMPFILE IN PLACE, NO NEED TO READ IT BACK IN MEMORY
+                    file_id.commit(output_path)
 
                 ## RUN CLAMAV ON ALL FOLDER
                 if plugin_obj.clamav_check:
@@ -444,73 +584,60 @@ def run_plugin(dump_obj, plugin_obj, es_url, params=None):
                 else:
                     match = {}
 
-                result = Result.objects.get(plugin=plugin_obj, dump=dump_obj)
+                # HASH DUMPED FILES IN PARALLEL, HASHLIB RELEASES THE GIL
+                with ThreadPoolExecutor(
+                    max_workers=min(8, len(paths))
+                ) as executor:
+                    digests = list(executor.map(sha256_checksum, paths))
 
                 # BULK CREATE EXTRACTED DUMP FOR EACH DUMPED FILE
                 ed = ExtractedDump.objects.bulk_create(
                     [
                         ExtractedDump(
                             result=result,
-                            path="{}/{}".format(local_path, file_id.preferred_filename),
-                            sha256=sha256_checksum(
-                                "{}/{}".format(local_path, file_id.preferred_filename)
-                            ),
-                            clamav=(
-                                match[
-                                    "{}/{}".format(
-                                        local_path,
-                                        file_id.preferred_filename,
-                                    )
-                                ][1]
-                                if "{}/{}".format(
-                                    local_path, file_id.preferred_filename
-                                )
-                                in match.keys()
-                                else None
-                            ),
+                            path=path,
+                            sha256=digest,
+                            clamav=(match[path][1] if path in match else None),
                         )
-                        for file_id in file_list
+                        for path, digest in zip(paths, digests)
                     ]
                 )
 
-                ## RUN VT AND REGIPY AS DASK SUBTASKS
+                ## RUN VT AND REGIPY AS DASK SUBTASKS, IN BATCHES OF FILES
                 if plugin_obj.vt_check or plugin_obj.regipy_check:
                     dask_client = get_client()
                     secede()
-                    tasks = []
-                    for file_id in file_list:
-                        task = dask_client.submit(
-                            run_vt if plugin_obj.vt_check else run_regipy,
-                            result.pk,
-                            "{}/{}".format(local_path, file_id.preferred_filename),
-                        )
-                        tasks.append(task)
+                    subtask = run_vt if plugin_obj.vt_check else run_regipy
+                    batch_size = 32
+                    tasks = [
+                        dask_client.submit(subtask, result.pk, paths[i:i + batch_size])
+                        for i in range(0, len(paths), batch_size)
+                    ]
                     results = dask_client.gather(tasks)
                     rejoin()
 
-            es = Elasticsearch(
-                [es_url],
-                request_timeout=60,
-                timeout=60,
-                max_retries=10,
-                retry_on_timeout=True,
-            )
-            helpers.bulk(
+            es = get_elastic_client(es_url)
+            for ok, item in helpers.parallel_bulk(
                 es,
                 gendata(
                     "{}_{}".format(dump_obj.index, plugin_obj.name.lower()),
                     plugin_obj.name,
                     json_data,
                 ),
-            )
+                chunk_size=settings.ELASTICSEARCH_BULK_CHUNK_SIZE,
+                max_chunk_bytes=10 * 1024 * 1024,
+                thread_count=4,
+                queue_size=4,
+                raise_on_error=False,
+            ):
+                if not ok:
+                    logging.warning(item)
             # EVERYTHING OK
-            result = Result.objects.get(plugin=plugin_obj, dump=dump_obj)
             result.result = 2
             result.description = error
             result.save()
         else:
             # OK BUT EMPTY
-            result = Result.objects.get(plugin=plugin_obj, dump=dump_obj)
             result.result = 1
             result.description = error
             result.save()
@@ -528,46 +655,75 @@ def run_plugin(dump_obj, plugin_obj, es_url, params=None):
         return 0
 
 
+def extract_member(zip_obj, member, extract_path, block_size=1024 * 1024):
+    """
+    Extracts a single zip member streaming with a large copy buffer.
+    Member names come from the upload, so strip drive prefixes and any
+    '..'/empty components like ZipFile._extract_member does
+    """
+    arcname = os.path.splitdrive(member)[1]
+    parts = [
+        x
+        for x in arcname.split("/")
+        if x not in ("", os.path.curdir, os.path.pardir)
+    ]
+    dest = os.path.join(extract_path, *parts)
+    if member.endswith("/"):
+        os.makedirs(dest, exist_ok=True)
+        return dest
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    with zip_obj.open(member) as src, open(dest, "wb") as dst:
+        shutil.copyfileobj(src, dst, length=block_size)
+    return dest
+
+
 def unzip_then_run(dump_pk, user_pk, es_url):
 
     dump = Dump.objects.get(pk=dump_pk)
 
-    # Unzip file is zipped
-    if is_zipfile(dump.upload.path):
+    # Unzip file if zipped, opening the archive only once
+    try:
         with ZipFile(dump.upload.path, "r") as zipObj:
             objs = zipObj.namelist()
             extract_path = pathlib.Path(dump.upload.path).parent
 
             # zip must contain one file with a memory dump
             if len(objs) == 1:
-                newpath = zipObj.extract(objs[0], extract_path)
+                newpath = extract_member(zipObj, objs[0], extract_path)
 
             # or a vmem + vmss + vmsn
-            elif any([x.lower().endswith(".vmem") for x in objs]):
-                zipObj.extractall(extract_path)
+            elif any(x.lower().endswith(".vmem") for x in objs):
                 for x in objs:
+                    member_path = extract_member(zipObj, x, extract_path)
                     if x.endswith(".vmem"):
-                        newpath = os.path.join(extract_path, x)
+                        newpath = member_path
 
             else:
                 # zip is unvalid
                 dump.status = 4
                 dump.save()
                 return
-    else:
+    except BadZipFile:
         newpath = dump.upload.path
 
     dump.upload.name = newpath
     dump.save()
 
-    dask_client = get_client()
-    secede()
-    tasks = []
-    for result in dump.result_set.all():
-        if result.result != 5:
-            task = dask_client.submit(run_plugin, dump, result.plugin, es_url)
-            tasks.append(task)
-    results = dask_client.gather(tasks)
-    rejoin()
+    # PREFETCH PLUGINS AND FAN OUT WITH A SINGLE MAP CALL
+    plugins_to_run = [
+        result.plugin
+        for result in dump.result_set.select_related("plugin").exclude(result=5)
+    ]
+    if plugins_to_run:
+        dask_client = get_client()
+        secede()
+        tasks = dask_client.map(
+            run_plugin,
+            [dump] * len(plugins_to_run),
+            plugins_to_run,
+            [es_url] * len(plugins_to_run),
+        )
+        results = dask_client.gather(tasks)
+        rejoin()
     dump.status = 2
     dump.save()
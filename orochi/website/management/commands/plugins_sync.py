@@ -4,6 +4,7 @@ import volatility.plugins
 from volatility import framework
 from volatility.framework import contexts
 from orochi.website.models import Plugin, UserPlugin
+from orochi.utils.volatility_dask_elk import get_parameters
 from django.contrib.auth import get_user_model
 
 
@@ -26,6 +27,8 @@ class Command(BaseCommand):
         ctx = contexts.Context()
         failures = framework.import_files(volatility.plugins, True)
         available_plugins = framework.list_plugins()
+        # Plugin set may have changed, drop cached parameter lists
+        get_parameters.cache_clear()
         self.stdout.write("Available Plugins: {}".format(", ".join(installed_plugins)))
 
         for plugin in plugins:
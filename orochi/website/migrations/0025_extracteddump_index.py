@@ -0,0 +1,17 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("website", "0024_auto_20200930_1428"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="extracteddump",
+            index=models.Index(
+                fields=["result", "path"], name="website_ed_result_path_idx"
+            ),
+        ),
+    ]
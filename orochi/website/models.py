@@ -2,7 +2,8 @@ from django.db import models
 from django.conf import settings
 from colorfield.fields import ColorField
 from django.contrib.auth import get_user_model
-from django.db.models.signals import post_save
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from guardian.shortcuts import assign_perm
 
@@ -112,6 +113,19 @@ class ExtractedDump(models.Model):
     vt_report = models.JSONField(blank=True, null=True)
     reg_array = models.JSONField(blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["result", "path"], name="website_ed_result_path_idx"),
+        ]
+
+
+@receiver(post_save, sender=Service)
+def clear_vt_cache(sender, instance, **kwargs):
+    """Service configuration changed, drop the cached virustotal client"""
+    from orochi.utils.volatility_dask_elk import get_vt_files
+
+    get_vt_files.cache_clear()
+
 
 @receiver(post_save, sender=Dump)
 def set_permission(sender, instance, created, **kwargs):
@@ -124,6 +138,17 @@ def set_permission(sender, instance, created, **kwargs):
         )
 
 
+@receiver(post_save, sender=Dump)
+@receiver(post_delete, sender=Dump)
+def clear_indices_cache(sender, instance, **kwargs):
+    """Dump list changed, drop every user's cached sidebar fragment"""
+    try:
+        # django-redis only; locmem (tests) has no pattern delete
+        cache.delete_pattern("indices:*")
+    except AttributeError:
+        cache.clear()
+
+
 @receiver(post_save, sender=get_user_model())
 def get_plugins(sender, instance, created, **kwargs):
     if created:
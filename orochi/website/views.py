@@ -4,15 +4,17 @@ import logging
 import shutil
 import json
 import shlex
-
-from glob import glob
+import fnmatch
+import functools
+import threading
 
 from django.contrib import messages
 from django.contrib.auth import get_user_model
-from django.db import transaction
+from django.core.cache import cache
+from django.db import connection, transaction
 from django.core import serializers
 from django.shortcuts import render, get_object_or_404, redirect
-from django.http import JsonResponse, Http404
+from django.http import JsonResponse, Http404, StreamingHttpResponse
 from django.template.loader import render_to_string
 from django.template.response import TemplateResponse
 from django.conf import settings
@@ -22,10 +24,15 @@ from django.core import management
 from urllib.request import pathname2url
 
 from elasticsearch import Elasticsearch
-from elasticsearch_dsl import Search
 
 from django.contrib.auth.decorators import login_required
-from guardian.shortcuts import get_objects_for_user, get_perms, assign_perm, remove_perm
+from django.contrib.contenttypes.models import ContentType
+from guardian.models import UserObjectPermission
+from guardian.shortcuts import (
+    get_objects_for_user,
+    get_users_with_perms,
+    assign_perm,
+)
 
 from orochi.website.models import Dump, Plugin, Result, ExtractedDump, UserPlugin
 from orochi.website.forms import DumpForm, EditDumpForm, ParametersForm
@@ -34,23 +41,131 @@ from dask import delayed
 from dask.distributed import Client, fire_and_forget
 from orochi.utils.volatility_dask_elk import unzip_then_run, run_plugin, get_parameters
 
+try:
+    import orjson
+
+    def fast_dumps(obj):
+        """orjson runs the big analysis/diff payloads at C speed"""
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+
+
+except ImportError:
+
+    def fast_dumps(obj):
+        return json.dumps(obj)
+
+
+@functools.lru_cache(maxsize=None)
+def _vt_key_frags(key):
+    """
+    Static dt/dd fragments for a vt_report key; the key set is tiny so the
+    per-row class checks and format calls collapse into a dict lookup
+    """
+    css = "text-danger" if key == "malicious" else ""
+    return (
+        f'<dt class="col-sm-3 {css}">{key}</dt><dd class="col-sm-9 {css}">',
+        "</dd>",
+    )
+
+
+# ONE GLOB PATTERN BUILDER PER PLUGIN THAT DUMPS FILES; DICT DISPATCH
+# REPLACES A PER-ROW if/elif CHAIN IN THE analysis() INNER LOOP
+GLOB_BUILDERS = {
+    "windows.dlllist.dlllist": lambda item, index, plugin: "{}/{}/{}/pid.{}.{}.*.{}.dmp".format(
+        settings.MEDIA_ROOT, index, plugin, item["PID"], item["Name"], item["Base"]
+    ),
+    "windows.malfind.malfind": lambda item, index, plugin: "{}/{}/{}/pid.{}.vad.{}-{}.dmp".format(
+        settings.MEDIA_ROOT,
+        index,
+        plugin,
+        item["PID"],
+        item["Start VPN"],
+        item["End VPN"],
+    ),
+    "windows.modscan.modscan": lambda item, index, plugin: "{}/{}/{}/{}.{}.{}.dmp".format(
+        settings.MEDIA_ROOT,
+        index,
+        plugin,
+        item["Path"].split("\\")[-1] if item["Name"] else "UnreadbleDLLName",
+        item["Offset"],
+        item["Base"],
+    ),
+    "windows.pslist.pslist": lambda item, index, plugin: "{}/{}/{}/pid.{}.*.dmp".format(
+        settings.MEDIA_ROOT, index, plugin, item["PID"]
+    ),
+    "windows.registry.hivelist.hivelist": lambda item, index, plugin: "{}/{}/{}/registry.*.{}.hive".format(
+        settings.MEDIA_ROOT, index, plugin, item["Offset"]
+    ),
+}
+GLOB_BUILDERS["linux.malfind.malfind"] = GLOB_BUILDERS["windows.malfind.malfind"]
+GLOB_BUILDERS["mac.malfind.malfind"] = GLOB_BUILDERS["windows.malfind.malfind"]
+GLOB_BUILDERS["windows.modules.modules"] = GLOB_BUILDERS["windows.modscan.modscan"]
+
+
+SVG_COLOR_TEMPLATE = (
+    '<svg class="bd-placeholder-img rounded mr-2" width="20" height="20" '
+    'xmlns="http://www.w3.org/2000/svg" preserveAspectRatio="xMidYMid slice" '
+    'focusable="false" role="img">'
+    '<rect width="100%" height="100%" fill="{}"></rect></svg>'
+)
+
+# SHARED CLIENTS, BUILT LAZILY ONCE PER PROCESS INSTEAD OF PER REQUEST
+_dask_client = None
+_es_client = None
+_clients_lock = threading.Lock()
+
+
+def get_dask_client():
+    """
+    Returns the shared dask client, connecting on first use
+    """
+    global _dask_client
+    if _dask_client is None:
+        with _clients_lock:
+            if _dask_client is None:
+                _dask_client = Client(
+                    settings.DASK_SCHEDULER_URL, set_as_default=False
+                )
+    return _dask_client
+
+
+def get_es_client():
+    """
+    Returns the shared elasticsearch client, built on first use
+    """
+    global _es_client
+    if _es_client is None:
+        with _clients_lock:
+            if _es_client is None:
+                _es_client = Elasticsearch([settings.ELASTICSEARCH_URL])
+    return _es_client
+
 
 ##############################
 # CHANGELOG
 ##############################
 
 
+CHANGELOG_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "CHANGELOG.md"
+)
+
+
+@functools.lru_cache(maxsize=1)
+def read_changelog(mtime):
+    """
+    Reads changelog once, cached until the file mtime changes
+    """
+    with open(CHANGELOG_PATH, "r") as f:
+        return f.read().replace("\n", "<br>")
+
+
 @login_required
 def changelog(request):
     """
     Returns changelog
     """
-    changelog_path = os.path.join(
-        os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "CHANGELOG.md"
-    )
-    with open(changelog_path, "r") as f:
-        changelog_content = "<br>".join([x for x in f.readlines()])
-    return JsonResponse({"note": changelog_content})
+    return JsonResponse({"note": read_changelog(os.path.getmtime(CHANGELOG_PATH))})
 
 
 ##############################
@@ -65,11 +180,18 @@ def plugins(request):
     """
     if request.is_ajax():
         indexes = request.GET.getlist("indexes[]")
-        # CHECK IF I CAN SEE INDEXES
-        dumps = Dump.objects.filter(index__in=indexes)
-        for dump in dumps:
-            if dump not in get_objects_for_user(request.user, "website.can_see"):
-                raise Http404("404")
+        # CHECK IF I CAN SEE INDEXES, ONE QUERY FOR ALL OF THEM
+        allowed_indexes = set(
+            get_objects_for_user(request.user, "website.can_see")
+            .filter(index__in=indexes)
+            .values_list("index", flat=True)
+        )
+        if (
+            Dump.objects.filter(index__in=indexes)
+            .exclude(index__in=allowed_indexes)
+            .exists()
+        ):
+            raise Http404("404")
         results = (
             Result.objects.filter(dump__index__in=indexes)
             .order_by("plugin__name")
@@ -85,7 +207,7 @@ def plugin_f_and_f(dump, plugin, params):
     """
     Fire and forget plugin on dask
     """
-    dask_client = Client(settings.DASK_SCHEDULER_URL)
+    dask_client = get_dask_client()
     fire_and_forget(
         dask_client.submit(run_plugin, dump, plugin, settings.ELASTICSEARCH_URL, params)
     )
@@ -106,14 +228,13 @@ def enable_plugin(request):
 
 
 def handle_uploaded_file(index, plugin, f):
-    if not os.path.exists("{}/{}/{}".format(settings.MEDIA_ROOT, index, plugin)):
-        os.mkdir("{}/{}/{}".format(settings.MEDIA_ROOT, index, plugin))
-    with open(
-        "{}/{}/{}/{}".format(settings.MEDIA_ROOT, index, plugin, f), "wb+"
-    ) as destination:
-        for chunk in f.chunks():
-            destination.write(chunk)
-    return "{}/{}/{}/{}".format(settings.MEDIA_ROOT, index, plugin, f)
+    folder = "{}/{}/{}".format(settings.MEDIA_ROOT, index, plugin)
+    os.makedirs(folder, exist_ok=True)
+    path = "{}/{}".format(folder, f)
+    with open(path, "wb") as destination:
+        # 8 MiB buffers keep the copy in big writes instead of 64k chunks
+        shutil.copyfileobj(f, destination, length=8 * 1024 * 1024)
+    return path
 
 
 @login_required
@@ -122,9 +243,10 @@ def plugin(request):
     Prepares for plugin resubmission on selected index with/without parameters
     """
     if request.method == "POST":
-        dump = get_object_or_404(Dump, index=request.POST.get("selected_index"))
-        if dump not in get_objects_for_user(request.user, "website.can_see"):
-            raise Http404("404")
+        dump = get_object_or_404(
+            get_objects_for_user(request.user, "website.can_see"),
+            index=request.POST.get("selected_index"),
+        )
         plugin = get_object_or_404(Plugin, name=request.POST.get("selected_plugin"))
         up = get_object_or_404(UserPlugin, plugin=plugin, user=request.user)
 
@@ -161,12 +283,14 @@ def plugin(request):
             params[filename] = "file:" + pathname2url(filepath)
 
         # REMOVE OLD DATA
-        es_client = Elasticsearch([settings.ELASTICSEARCH_URL])
+        es_client = get_es_client()
         es_client.indices.delete(
             "{}_{}".format(dump.index, plugin.name.lower()), ignore=[400, 404]
         )
+        # NO SIGNALS OR CASCADES ON ExtractedDump: ONE DELETE STATEMENT,
+        # NO PK FETCH ROUND-TRIP
         eds = ExtractedDump.objects.filter(result=result)
-        eds.delete()
+        eds._raw_delete(eds.db)
 
         result.result = 0
         request.description = None
@@ -228,7 +352,7 @@ def analysis(request):
     Get and trasform results for selected plugin on selected indexes
     """
     if request.is_ajax():
-        es_client = Elasticsearch([settings.ELASTICSEARCH_URL])
+        es_client = get_es_client()
 
         # GET DATA
         indexes = request.GET.getlist("indexes[]")
@@ -237,11 +361,15 @@ def analysis(request):
         # GET PLUGIN INFO
         plugin = get_object_or_404(Plugin, name=plugin)
 
-        # GET DICT OF COLOR AND CHECK PERMISSIONS
-        dumps = Dump.objects.filter(index__in=indexes)
+        # GET DICT OF COLOR AND CHECK PERMISSIONS, ONE QUERY FOR ALL INDEXES
+        allowed_indexes = set(
+            get_objects_for_user(request.user, "website.can_see")
+            .filter(index__in=indexes)
+            .values_list("index", flat=True)
+        )
         colors = {}
-        for dump in dumps:
-            if dump not in get_objects_for_user(request.user, "website.can_see"):
+        for dump in Dump.objects.filter(index__in=indexes).only("index", "color"):
+            if dump.index not in allowed_indexes:
                 raise Http404("404")
             colors[dump.index] = dump.color
 
@@ -251,11 +379,17 @@ def analysis(request):
         )
 
         # GET ALL EXTRACTED DUMP DUMP
+        # result pks stay in a subquery and iterator() skips the queryset cache
         ex_dumps = {
             x["path"]: x
-            for x in ExtractedDump.objects.filter(result__in=results).values(
-                "path", "sha256", "clamav", "vt_report", "pk"
-            )
+            for x in ExtractedDump.objects.filter(result_id__in=results.values("pk"))
+            .values("path", "sha256", "clamav", "vt_report", "pk")
+            .iterator(chunk_size=2000)
+        }
+
+        # RENDER THE COLOR BADGE ONCE PER INDEX, NOT ONCE PER ROW
+        color_svg = {
+            index: SVG_COLOR_TEMPLATE.format(color) for index, color in colors.items()
         }
 
         # SEARCH FOR ITEMS AND KEEP INDEX
@@ -274,28 +408,26 @@ def analysis(request):
                 "index": res.dump.index,
                 "result": res.get_result_display(),
                 "description": res.description,
-                "color": """<svg class="bd-placeholder-img rounded mr-2" width="20" height="20" xmlns="http://www.w3.org/2000/svg" preserveAspectRatio="xMidYMid slice" focusable="false" role="img">
-                        <rect width="100%" height="100%" fill="{}"></rect>
-                        </svg>
-                    """.format(
-                    colors[res.dump.index]
-                ),
+                "color": color_svg[res.dump.index],
             }
             for res in results
         ]
 
         data = []
         if indexes_list:
-            s = Search(using=es_client, index=indexes_list).extra(size=10000)
-            result = s.execute()
-            # ANNOTATE RESULTS WITH INDEX NAME
+            # ONE MSEARCH BODY PER INDEX: SHARDS RUN IN PARALLEL AND EACH
+            # INDEX GETS ITS OWN 10K WINDOW INSTEAD OF A SHARED ONE
+            body = []
+            for es_index in indexes_list:
+                body.append({"index": es_index})
+                body.append({"query": {"match_all": {}}, "size": 10000})
+            responses = es_client.msearch(body=body)["responses"]
+            # ANNOTATE RESULTS WITH INDEX NAME; partition SPLITS ONCE AND
+            # KEEPS THE FULL PLUGIN NAME AFTER THE FIRST UNDERSCORE
             info = [
-                (
-                    hit.to_dict(),
-                    hit.meta.index.split("_")[0],
-                    hit.meta.index.split("_")[1],
-                )
-                for hit in result
+                (hit["_source"], *hit["_index"].partition("_")[::2])
+                for response in responses
+                for hit in response.get("hits", {}).get("hits", [])
             ]
 
             row_colors = {
@@ -305,75 +437,39 @@ def analysis(request):
                 "Changed Date": "#FFFF00",
             }
 
+            # LIST EACH DUMP FOLDER ONCE INSTEAD OF ONE GLOB PER ROW
+            dir_cache = {}
+
             for item, item_index, plugin_index in info:
                 if item_index != ".kibana":
 
                     if "File output" in item.keys():
 
-                        glob_path = None
-
-                        if plugin_index == "windows.dlllist.dlllist":
-                            glob_path = "{}/{}/{}/pid.{}.{}.*.{}.dmp".format(
-                                settings.MEDIA_ROOT,
-                                item_index,
-                                plugin.name,
-                                item["PID"],
-                                item["Name"],
-                                item["Base"],
-                            )
-                        elif plugin_index in (
-                            "windows.malfind.malfind",
-                            "linux.malfind.malfind",
-                            "mac.malfind.malfind",
-                        ):
-                            glob_path = "{}/{}/{}/pid.{}.vad.{}-{}.dmp".format(
-                                settings.MEDIA_ROOT,
-                                item_index,
-                                plugin.name,
-                                item["PID"],
-                                item["Start VPN"],
-                                item["End VPN"],
-                            )
-                        elif plugin_index in [
-                            "windows.modscan.modscan",
-                            "windows.modules.modules",
-                        ]:
-                            glob_path = "{}/{}/{}/{}.{}.{}.dmp".format(
-                                settings.MEDIA_ROOT,
-                                item_index,
-                                plugin.name,
-                                item["Path"].split("\\")[-1]
-                                if item["Name"]
-                                else "UnreadbleDLLName",
-                                item["Offset"],
-                                item["Base"],
-                            )
-                        elif plugin_index == "windows.pslist.pslist":
-                            glob_path = "{}/{}/{}/pid.{}.*.dmp".format(
-                                settings.MEDIA_ROOT,
-                                item_index,
-                                plugin.name,
-                                item["PID"],
-                            )
-                        elif plugin_index == "windows.registry.hivelist.hivelist":
-                            glob_path = "{}/{}/{}/registry.*.{}.hive".format(
-                                settings.MEDIA_ROOT,
-                                item_index,
-                                plugin.name,
-                                item["Offset"],
-                            )
+                        builder = GLOB_BUILDERS.get(plugin_index)
+                        glob_path = (
+                            builder(item, item_index, plugin.name) if builder else None
+                        )
 
                         if glob_path:
                             try:
-                                path = glob(glob_path)[0]
+                                folder, pattern = os.path.split(glob_path)
+                                if folder not in dir_cache:
+                                    dir_cache[folder] = (
+                                        sorted(os.listdir(folder))
+                                        if os.path.isdir(folder)
+                                        else []
+                                    )
+                                path = "{}/{}".format(
+                                    folder,
+                                    fnmatch.filter(dir_cache[folder], pattern)[0],
+                                )
                                 down_path = path.replace(
                                     settings.MEDIA_ROOT, settings.MEDIA_URL.rstrip("/")
                                 )
 
-                                item["download"] = (
-                                    '<a href="{}">⬇️</a>'.format(down_path)
-                                    if os.path.exists(path)
-                                    else ""
+                                # NAME COMES FROM THE LISTING, FILE EXISTS FOR SURE
+                                item["download"] = '<a href="{}">⬇️</a>'.format(
+                                    down_path
                                 )
 
                                 item["sha256"] = ex_dumps.get(path, {}).get(
@@ -389,28 +485,16 @@ def analysis(request):
                                         "vt_report", {}
                                     )
 
-                                    item[
-                                        "vt_report"
-                                    ] = '<dl class="row">{}</dl>'.format(
-                                        "".join(
-                                            [
-                                                '<dt class="col-sm-3 {}">{}</dt><dd class="col-sm-9 {}">{}</dd>'.format(
-                                                    "text-danger"
-                                                    if k == "malicious"
-                                                    else "",
-                                                    k,
-                                                    "text-danger"
-                                                    if k == "malicious"
-                                                    else "",
-                                                    v,
-                                                )
-                                                for k, v in vt_data.items()
-                                                if v != 0
-                                            ]
-                                        )
-                                        if vt_data
-                                        else ""
-                                    )
+                                    if vt_data:
+                                        parts = ['<dl class="row">']
+                                        for k, v in vt_data.items():
+                                            if v != 0:
+                                                pre, suf = _vt_key_frags(k)
+                                                parts.append(f"{pre}{v}{suf}")
+                                        parts.append("</dl>")
+                                        item["vt_report"] = "".join(parts)
+                                    else:
+                                        item["vt_report"] = '<dl class="row"></dl>'
 
                                 if plugin.regipy_check:
                                     value = ex_dumps.get(path, {}).get("pk", None)
@@ -449,11 +533,7 @@ def analysis(request):
                                 for oc in other_columns:
                                     row[oc] = item[oc]
                                 row.update(
-                                    {
-                                        "color": """<svg class="bd-placeholder-img rounded mr-2" width="20" height="20" xmlns="http://www.w3.org/2000/svg" preserveAspectRatio="xMidYMid slice" focusable="false" role="img"><rect width="100%" height="100%" fill="{}"></rect></svg>""".format(
-                                            colors[item_index]
-                                        )
-                                    }
+                                    {"color": color_svg[item_index]}
                                 )
                                 data.append(row)
 
@@ -465,21 +545,13 @@ def analysis(request):
                             for oc in other_columns:
                                 row[oc] = item[oc]
                             row.update(
-                                {
-                                    "color": """<svg class="bd-placeholder-img rounded mr-2" width="20" height="20" xmlns="http://www.w3.org/2000/svg" preserveAspectRatio="xMidYMid slice" focusable="false" role="img"><rect width="100%" height="100%" fill="{}"></rect></svg>""".format(
-                                        colors[item_index]
-                                    )
-                                }
+                                {"color": color_svg[item_index]}
                             )
                             data.append(row)
 
                     else:
                         item.update(
-                            {
-                                "color": """<svg class="bd-placeholder-img rounded mr-2" width="20" height="20" xmlns="http://www.w3.org/2000/svg" preserveAspectRatio="xMidYMid slice" focusable="false" role="img"><rect width="100%" height="100%" fill="{}"></rect></svg>""".format(
-                                    colors[item_index]
-                                )
-                            }
+                            {"color": color_svg[item_index]}
                         )
 
                         data.append(item)
@@ -487,24 +559,23 @@ def analysis(request):
         if plugin.name in ["windows.pstree.PsTree", "linux.pstree.PsTree"]:
 
             def change_keys(obj):
-                if isinstance(obj, dict):
-                    new = {}
-                    for k, v in obj.items():
-                        if k == "__children" and v != []:
-                            new["children"] = change_keys(v)
-                        elif k == "PID":
-                            new["text"] = v
-                        elif not v:
-                            new.setdefault("data", {})[k] = "-"
-                        else:
-                            new.setdefault("data", {})[k] = v
-
-                elif isinstance(obj, list):
-                    new = []
-                    for v in obj:
-                        new.append(change_keys(v))
-                else:
+                if isinstance(obj, list):
+                    return [change_keys(v) for v in obj]
+                if not isinstance(obj, dict):
                     return obj
+                # data is allocated once, no setdefault re-hashing per key
+                new = {}
+                data = {}
+                for k, v in obj.items():
+                    if k == "__children":
+                        if v:
+                            new["children"] = [change_keys(x) for x in v]
+                    elif k == "PID":
+                        new["text"] = v
+                    else:
+                        data[k] = v if v else "-"
+                if data:
+                    new["data"] = data
                 return new
 
             new_data = [change_keys(item) for item in data]
@@ -517,20 +588,36 @@ def analysis(request):
                 columns = None
 
             context = {
-                "data": json.dumps(new_data),
-                "columns": json.dumps(columns),
+                "data": fast_dumps(new_data),
+                "columns": fast_dumps(columns),
                 "note": note,
                 "tree": True,
                 "empty": False if new_data else True,
             }
+            return render(request, "website/partial_analysis.html", context)
         else:
-            context = {
-                "data": data,
-                "note": note,
-                "children": False,
-                "tree": False,
-            }
-        return render(request, "website/partial_analysis.html", context)
+            # STREAM THE TABLE IN ROW CHUNKS, SO A BIG RESULT SET IS NEVER
+            # HELD AS ONE TENS-OF-MB HTML STRING BEFORE THE FIRST BYTE GOES OUT
+            columns = (
+                [k for k in data[0].keys() if k != "__children"] if data else None
+            )
+
+            def stream_table(chunk_size=500):
+                yield render_to_string(
+                    "website/partial_analysis_head.html",
+                    {"note": note, "columns": columns},
+                    request=request,
+                )
+                for start in range(0, len(data), chunk_size):
+                    yield render_to_string(
+                        "website/partial_analysis_rows.html",
+                        {"items": data[start:start + chunk_size], "children": False},
+                    )
+                if columns:
+                    yield "</tbody></table>"
+                yield "</div>"
+
+            return StreamingHttpResponse(stream_table(), content_type="text/html")
     else:
         raise Http404("404")
 
@@ -547,7 +634,7 @@ def json_view(request, pk):
     if ed.result.dump not in get_objects_for_user(request.user, "website.can_see"):
         raise Http404("404")
 
-    context = {"data": json.dumps(ed.reg_array["values"])}
+    context = {"data": fast_dumps(ed.reg_array["values"])}
 
     return render(request, "website/json_view.html", context)
 
@@ -559,20 +646,24 @@ def diff_view(request, index_a, index_b, plugin):
     """
     obj_a = get_object_or_404(Dump, index=index_a)
     obj_b = get_object_or_404(Dump, index=index_b)
-    es_client = Elasticsearch([settings.ELASTICSEARCH_URL])
-    search_a = (
-        Search(using=es_client, index=["{}_{}".format(index_a, plugin.lower())])
-        .extra(size=10000)
-        .execute()
+    es_client = get_es_client()
+    # ONE MSEARCH ROUND-TRIP FOR BOTH SIDES; _source IS ALREADY A PLAIN DICT
+    query = {"query": {"match_all": {}}, "size": 10000}
+    resp = es_client.msearch(
+        body=[
+            {"index": "{}_{}".format(index_a, plugin.lower())},
+            query,
+            {"index": "{}_{}".format(index_b, plugin.lower())},
+            query,
+        ]
     )
-    info_a = json.dumps([hit.to_dict() for hit in search_a])
-
-    search_b = (
-        Search(using=es_client, index=["{}_{}".format(index_b, plugin.lower())])
-        .extra(size=10000)
-        .execute()
+    resp_a, resp_b = resp["responses"]
+    info_a = fast_dumps(
+        [h["_source"] for h in resp_a.get("hits", {}).get("hits", [])]
+    )
+    info_b = fast_dumps(
+        [h["_source"] for h in resp_b.get("hits", {}).get("hits", [])]
     )
-    info_b = json.dumps([hit.to_dict() for hit in search_b])
 
     context = {"info_a": info_a, "info_b": info_b}
 
@@ -607,11 +698,12 @@ def edit(request):
         if dump not in get_objects_for_user(request.user, "website.can_see"):
             raise Http404("404")
 
-        auth_users = [
-            user.pk
-            for user in get_user_model().objects.all()
-            if "can_see" in get_perms(user, dump) and user != request.user
-        ]
+        # SINGLE JOIN ON GUARDIAN TABLES, NO PER-USER PERMISSION PROBE
+        auth_users = list(
+            get_users_with_perms(dump, only_with_perms_in=["can_see"])
+            .exclude(pk=request.user.pk)
+            .values_list("pk", flat=True)
+        )
 
         form = EditDumpForm(
             data=request.POST,
@@ -621,43 +713,36 @@ def edit(request):
         )
         if form.is_valid():
             dump = form.save()
-            for user_pk in form.cleaned_data["authorized_users"]:
-                user = get_user_model().objects.get(pk=user_pk)
-                if user.pk not in auth_users:
-                    assign_perm(
-                        "can_see",
-                        user,
-                        dump,
-                    )
-            for user_pk in auth_users:
-                if user_pk not in form.cleaned_data["authorized_users"]:
-                    user = get_user_model().objects.get(pk=user_pk)
-                    remove_perm("can_see", user, dump)
+            # DIFF THE PERMISSION SETS AND LET GUARDIAN BATCH EACH SIDE
+            chosen_users = {int(pk) for pk in form.cleaned_data["authorized_users"]}
+            to_add = chosen_users - set(auth_users)
+            to_remove = set(auth_users) - chosen_users
+            if to_add:
+                assign_perm(
+                    "can_see", get_user_model().objects.filter(pk__in=to_add), dump
+                )
+            if to_remove:
+                # guardian has no bulk removal for many users on one object,
+                # so drop the permission rows directly in a single delete
+                UserObjectPermission.objects.filter(
+                    user_id__in=to_remove,
+                    permission__codename="can_see",
+                    content_type=ContentType.objects.get_for_model(Dump),
+                    object_pk=dump.pk,
+                ).delete()
 
             data["form_is_valid"] = True
-            data["dumps"] = render_to_string(
-                "website/partial_indices.html",
-                {
-                    "dumps": [
-                        x
-                        for x in get_objects_for_user(request.user, "website.can_see")
-                        .values_list(
-                            "index", "color", "name", "operating_system", "author"
-                        )
-                        .order_by("-created_at")
-                    ]
-                },
-                request=request,
-            )
+            data["dumps"] = render_indices(request)
         else:
             data["form_is_valid"] = False
     else:
         dump = get_object_or_404(Dump, index=request.GET.get("index"))
-        auth_users = [
-            user.pk
-            for user in get_user_model().objects.all()
-            if "can_see" in get_perms(user, dump) and user != request.user
-        ]
+        # SINGLE JOIN ON GUARDIAN TABLES, NO PER-USER PERMISSION PROBE
+        auth_users = list(
+            get_users_with_perms(dump, only_with_perms_in=["can_see"])
+            .exclude(pk=request.user.pk)
+            .values_list("pk", flat=True)
+        )
         form = EditDumpForm(
             instance=dump, initial={"authorized_users": auth_users}, user=request.user
         )
@@ -671,11 +756,44 @@ def edit(request):
     return JsonResponse(data)
 
 
+def render_indices(request):
+    """
+    Rendered index list for the sidebar, cached per user; Dump signals
+    drop the whole indices: namespace on any change
+    """
+    key = "indices:{}".format(request.user.pk)
+    html = cache.get(key)
+    if html is None:
+        html = render_to_string(
+            "website/partial_indices.html",
+            {
+                "dumps": list(
+                    get_objects_for_user(request.user, "website.can_see")
+                    .values_list("index", "color", "name", "operating_system", "author")
+                    .order_by("-created_at")
+                )
+            },
+            request=request,
+        )
+        cache.set(key, html, 300)
+    return html
+
+
+def finish_dump_creation(form, dump_pk, dump_index, user_pk):
+    """
+    Filesystem work and dask hand-off for a new dump, run after the
+    transaction commits so the DB connection is not held during disk I/O
+    """
+    os.mkdir("{}/{}".format(settings.MEDIA_ROOT, dump_index))
+    form.delete_temporary_files()
+    index_f_and_f(dump_pk, user_pk)
+
+
 def index_f_and_f(dump_pk, user_pk):
     """
     Run all plugin for a new index on dask
     """
-    dask_client = Client(settings.DASK_SCHEDULER_URL)
+    dask_client = get_dask_client()
     fire_and_forget(
         dask_client.submit(unzip_then_run, dump_pk, user_pk, settings.ELASTICSEARCH_URL)
     )
@@ -697,48 +815,54 @@ def create(request):
                 dump.upload = form.cleaned_data["upload"]
                 dump.index = str(uuid.uuid1())
                 dump.save()
-                form.delete_temporary_files()
-                os.mkdir("{}/{}".format(settings.MEDIA_ROOT, dump.index))
                 data["form_is_valid"] = True
 
                 # for each plugin enabled and for that os I create a result
                 # if the user selected that for automation, run it immediately on dask
-                Result.objects.bulk_create(
-                    [
-                        Result(
-                            plugin=up.plugin,
-                            dump=dump,
-                            result=5 if not up.automatic else 0,
+                if connection.vendor == "postgresql":
+                    # LET THE DB GENERATE THE ROWS, NO ROUND-TRIP PER PLUGIN
+                    with connection.cursor() as cursor:
+                        cursor.execute(
+                            """
+                            INSERT INTO website_result (dump_id, plugin_id, result, updated_at)
+                            SELECT %s, up.plugin_id, CASE WHEN up.automatic THEN 0 ELSE 5 END, CURRENT_TIMESTAMP
+                            FROM website_userplugin up
+                            JOIN website_plugin p ON p.id = up.plugin_id
+                            WHERE up.user_id = %s
+                              AND p.disabled = false
+                              AND p.operating_system IN (%s, 'Other')
+                            """,
+                            [dump.pk, request.user.pk, dump.operating_system],
                         )
-                        for up in UserPlugin.objects.filter(
-                            plugin__operating_system__in=[
-                                dump.operating_system,
-                                "Other",
-                            ],
-                            user=request.user,
-                            plugin__disabled=False,
-                        )
-                    ]
-                )
+                else:
+                    # FALLBACK FOR BACKENDS WITHOUT THE FAST PATH (EG SQLITE TESTS)
+                    Result.objects.bulk_create(
+                        [
+                            Result(
+                                plugin=up.plugin,
+                                dump=dump,
+                                result=5 if not up.automatic else 0,
+                            )
+                            for up in UserPlugin.objects.filter(
+                                plugin__operating_system__in=[
+                                    dump.operating_system,
+                                    "Other",
+                                ],
+                                user=request.user,
+                                plugin__disabled=False,
+                            )
+                        ]
+                    )
 
-                transaction.on_commit(lambda: index_f_and_f(dump.pk, request.user.pk))
+                transaction.on_commit(
+                    lambda: finish_dump_creation(
+                        form, dump.pk, dump.index, request.user.pk
+                    )
+                )
 
             # Return the new list of available indexes
             data["form_is_valid"] = True
-            data["dumps"] = render_to_string(
-                "website/partial_indices.html",
-                {
-                    "dumps": [
-                        x
-                        for x in get_objects_for_user(request.user, "website.can_see")
-                        .values_list(
-                            "index", "color", "name", "operating_system", "author"
-                        )
-                        .order_by("-created_at")
-                    ]
-                },
-                request=request,
-            )
+            data["dumps"] = render_indices(request)
         else:
             data["form_is_valid"] = False
     else:
@@ -759,11 +883,11 @@ def delete(request):
     Delete an index
     """
     if request.is_ajax():
-        es_client = Elasticsearch([settings.ELASTICSEARCH_URL])
+        es_client = get_es_client()
         index = request.GET.get("index")
-        dump = Dump.objects.get(index=index)
-        if dump not in get_objects_for_user(request.user, "website.can_see"):
-            Http404("404")
+        dump = get_object_or_404(
+            get_objects_for_user(request.user, "website.can_see"), index=index
+        )
         dump.delete()
         es_client.indices.delete(index=f"{index}*", ignore=[400, 404])
         shutil.rmtree("{}/{}".format(settings.MEDIA_ROOT, dump.index))